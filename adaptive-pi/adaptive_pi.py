@@ -20,11 +20,17 @@ e_2_dot = e_dot + lambda * e
 With the controllers error integrator state and two parameter estimation states, the
 closed loop system has four states. The closed-loop system inputs are the desired
 output command x_d and its derivative x_d_dot. The plant state x is the output.
+
+The plant and controller are collapsed into a single four-state vector field which is
+integrated directly with LSODA, so each solver step makes one cheap Python call rather
+than routing signals through an interconnected I/O system.
 """
 
-import control
+import argparse
+import math
+import os
 import numpy as np
-import matplotlib.pyplot as plt
+from scipy.integrate import odeint
 
 # Plant parameters
 J = 2
@@ -43,144 +49,222 @@ B_HAT_0 = 0.1
 # Flag to disable adaptive control
 IS_ADAPTIVE = 1
 
-# Plant
-# u_input: u
-# x_state: x
-# y_output: x
-SS_PLANT = control.StateSpace(-B/J, 1/J, 1, 0)
-
-IO_DC_MOTOR = control.LinearIOSystem(
-    SS_PLANT,
-    inputs=('u'),
-    outputs=('x'),
-    states=('x'),
-    name='plant'
-)
-
-def adaptive_pi_state(_t, x_state, u_input, _params):
-    """Internal state of adpative PI controller"""
+# Frequency of desired output command [rad/s]
+OMEGA_D = 0.2 * np.pi
 
-    # Controller inputs
-    x_d = u_input[0]
-    x_d_dot = u_input[1]
-    x = u_input[2]
+def adaptive_pi_control(x_cl, x_d, x_d_dot):
+    """
+    Adaptive PI control law and errors
+    Accepts a single closed-loop state or a (4, k) array of closed-loop states
+    """
 
-    # Controller state
-    e_i = x_state[2]
+    # Closed-loop state
+    x = x_cl[0]
+    j_hat = x_cl[1]
+    b_hat = x_cl[2]
+    e_i = x_cl[3]
 
     # Algebraic relationships
     e = x_d - x
     e_1 = x_d_dot + LAMBDA * e
     e_2 = e + LAMBDA * e_i
 
-    # Dynamics
-    d_j_hat = GAMMA_1 * e_2 * e_1 * IS_ADAPTIVE
-    d_b_hat = GAMMA_2 * e_2 * x * IS_ADAPTIVE
-    e_i_dot = e
+    # Control law
+    u = j_hat * e_1 + b_hat * x + K * e_2
 
-    return [d_j_hat, d_b_hat, e_i_dot]
+    return u, e, e_1, e_2
 
-def adaptive_pi_output(_t, x_state, u_input, _params):
-    """Algebraic output from adaptive PI controller"""
+def adaptive_pi_closed_loop(t, x_cl, gamma_1=GAMMA_1, gamma_2=GAMMA_2):
+    """Closed-loop dynamics of plant and adaptive PI controller"""
 
-    # Controller inputs
-    x_d = u_input[0]
-    x_d_dot = u_input[1]
-    x = u_input[2]
+    # Desired output command and its derivative
+    x_d = np.sin(OMEGA_D * t)
+    x_d_dot = np.cos(OMEGA_D * t)
 
-    # Controller state
-    j_hat = x_state[0]
-    b_hat = x_state[1]
-    e_i = x_state[2]
+    x = x_cl[0]
+    u, e, e_1, e_2 = adaptive_pi_control(x_cl, x_d, x_d_dot)
 
-    # Algebraic relationships
-    e = x_d - x
-    e_1 = x_d_dot + LAMBDA * e
-    e_2 = e + LAMBDA * e_i
+    # Dynamics: plant
+    x_dot = (-B * x + u) / J
 
-    # Control law
-    u = j_hat * e_1 + b_hat * x + K * e_2
+    # Dynamics: controller
+    d_j_hat = gamma_1 * e_2 * e_1 * IS_ADAPTIVE
+    d_b_hat = gamma_2 * e_2 * x * IS_ADAPTIVE
+    e_i_dot = e
+
+    return np.array([x_dot, d_j_hat, d_b_hat, e_i_dot])
+
+def adaptive_pi_closed_loop_batch(t, x_batch, gamma_1, gamma_2):
+    """
+    Closed-loop dynamics of a batch of independent closed-loop systems
+    The flattened state x_batch is a (4, n) array of closed-loop states with one column
+    per system, and gamma_1, gamma_2 are the (n,) adaptation gains of each system
+    """
+
+    return adaptive_pi_closed_loop(t, x_batch.reshape(4, -1), gamma_1, gamma_2).ravel()
+
+def adaptive_pi_output(x_cl, x_d, x_d_dot):
+    """Algebraic output from adaptive PI controller"""
 
-    return [u, x_state[0], x_state[1]]
-
-IO_ADAPTIVE_PI = control.NonlinearIOSystem(
-    adaptive_pi_state,
-    adaptive_pi_output,
-    inputs=3,
-    outputs=('u', 'j_hat', 'b_hat'),
-    states=3,
-    name='control',
-    dt=0
-)
-
-# Define the closed-loop system
-# x_cl = [plant.x, control.x[0], control.x[1], control.x[2]]
-#      = [motorx, j_hat, b_hat, e_i]
-# u_cl = [xd, xddot]
-# y_cl = [motorx, Jhat, Bhat]
-IO_CLOSED = control.InterconnectedSystem(
-    (IO_DC_MOTOR, IO_ADAPTIVE_PI),
-    connections=(
-        ('plant.u', 'control.u'),
-        ('control.u[2]', 'plant.x')
-    ),
-    inplist=('control.u[0]', 'control.u[1]'),
-    outlist=('plant.x', 'control.j_hat', 'control.b_hat', 'control.u'),
-    dt=0
-)
+    return adaptive_pi_control(x_cl, x_d, x_d_dot)[0]
 
 # Set simulation duration and time steps
 N_POINTS = 3000
 T_F = 60
 
+# Set integrator tolerances: absolute only
+RTOL = 0
+ATOL = 1e-6
+
 # Set initial conditions
+# x_cl = [motor_x, j_hat, b_hat, e_i]
 X0 = np.zeros((4, 1))
 X0[0] = 1
 X0[1] = J_HAT_0
 X0[2] = B_HAT_0
 
-# Define simulation time span and control input
+# Define simulation time span and desired output command
 T = np.linspace(0, T_F, N_POINTS)
-U = np.zeros((2, N_POINTS))
-XD_IN = np.sin(0.2 * np.pi * T)
-XD_DOT_IN = np.cos(0.2 * np.pi * T)
-U[0, :] = XD_IN
-U[1, :] = XD_DOT_IN
-
-# Simulate the system
-T_OUT, Y_OUT = control.input_output_response(IO_CLOSED, T, U, X0)
+PHASE = OMEGA_D * T
+XD_IN = np.sin(PHASE)
+XD_DOT_IN = np.cos(PHASE)
+
+def simulate_batch(j_hats_0, b_hats_0, gammas):
+    """
+    Simulate a batch of closed-loop systems together as a single ODE
+    Input: initial estimates j_hats_0 and b_hats_0 of shape (n,), and the adaptation
+    gains [gamma_1, gamma_2] of each system as gammas of shape (n, 2)
+    Output: closed-loop states [motor_x, j_hat, b_hat, e_i] of shape (n, 4, N_POINTS)
+    """
+
+    j_hats_0 = np.asarray(j_hats_0, dtype=float).ravel()
+    n_batch = j_hats_0.size
+    gammas = np.asarray(gammas, dtype=float).reshape(n_batch, 2)
+
+    x0_batch = np.zeros((4, n_batch))
+    x0_batch[0] = X0[0]
+    x0_batch[1] = j_hats_0
+    x0_batch[2] = b_hats_0
+    x0_batch[3] = X0[3]
+
+    x_out = odeint(
+        adaptive_pi_closed_loop_batch,
+        x0_batch.ravel(),
+        T,
+        args=(gammas[:, 0], gammas[:, 1]),
+        tfirst=True,
+        rtol=RTOL,
+        atol=ATOL
+    )
+
+    return x_out.reshape(N_POINTS, 4, n_batch).transpose(2, 1, 0)
+
+def simulate():
+    """
+    Simulate the closed-loop system
+    Output: time t_out and closed-loop output y_out = [motor_x, j_hat, b_hat, u]
+    """
+
+    x_out = odeint(
+        adaptive_pi_closed_loop, X0.ravel(), T, tfirst=True, rtol=RTOL, atol=ATOL).T
+    y_out = np.vstack((x_out[0:3], adaptive_pi_output(x_out, XD_IN, XD_DOT_IN)))
+
+    return T, y_out
 
 # Plot the response
-plt.rc('text', usetex=True)
-plt.rc('font', family='sans')
-
-FIG = plt.figure(1, figsize=(6, 6), dpi=300, facecolor='w', edgecolor='k')
-
+# Define plot styles
 RED = '#f62d73'
 BLUE = '#1269d3'
 WHITE = '#ffffff'
+FIG_SIZE = (6, 6)
+FIG_DPI = 100
+SAVE_DPI = 300
+
+def _pyplot():
+    """
+    Import and return matplotlib.pyplot with the non-interactive Agg backend
+    Deferred until plotting, so that importing the module and simulating stay cheap
+    """
+
+    # pylint: disable=import-outside-toplevel
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    return plt
+
+def init_figure():
+    """
+    Build the response figure once, returning it with its line artists
+    Lines: [x_d, x, j_hat, b_hat, u]
+    """
+
+    plt = _pyplot()
+
+    plt.rc('text', usetex=bool(os.environ.get('PUBLISH')))
+    plt.rc('font', family='sans')
+
+    fig = plt.figure(figsize=FIG_SIZE, dpi=FIG_DPI, facecolor='w', edgecolor='k')
+
+    ax_1 = fig.add_subplot(3, 1, 1)
+    line_x_d, = ax_1.plot([], [], label=r'$x_{d}$', color=RED)
+    line_x, = ax_1.plot([], [], label=r'$x$', color=BLUE)
+    ax_1.set_ylabel('Motor Velocity')
+
+    ax_2 = fig.add_subplot(3, 1, 2)
+    line_j_hat, = ax_2.plot([], [], label=r'$\hat{J}$', color=RED)
+    line_b_hat, = ax_2.plot([], [], label=r'$\hat{B}$', color=BLUE)
+    ax_2.set_ylabel('Parameter Estimates')
+
+    ax_3 = fig.add_subplot(3, 1, 3)
+    line_u, = ax_3.plot([], [], label=r'$u$', color=BLUE)
+    ax_3.set_ylabel('Control Effort')
+
+    for ax in (ax_1, ax_2, ax_3):
+        ax.set_xlabel(r'time ($t$)', fontname="Times New Roman", fontsize=9, fontweight=100)
+        ax.legend(loc="lower right", bbox_to_anchor=(1, 0), fontsize=9)
+        ax.set_facecolor(WHITE)
+
+    return fig, [line_x_d, line_x, line_j_hat, line_b_hat, line_u]
+
+def update_figure(lines, t_out, x_d, y_out):
+    """Replace the data of the figure lines with a new response and rescale the axes"""
+
+    # Downsample to at most two samples per horizontal pixel of the saved figure
+    step = math.ceil(len(t_out) / (2 * FIG_SIZE[0] * SAVE_DPI))
+
+    for line, y_line in zip(lines, (x_d, *y_out)):
+        line.set_data(t_out[::step], y_line[::step])
+
+    for ax in {line.axes for line in lines}:
+        ax.relim()
+        ax.autoscale_view()
+
+def plot(t_out, y_out):
+    """Plot the closed-loop response and save the figure"""
+
+    plt = _pyplot()
+
+    fig, lines = init_figure()
+    update_figure(lines, t_out, np.sin(OMEGA_D * t_out), y_out)
+    fig.savefig('adaptive_pi.png', dpi=SAVE_DPI, bbox_inches='tight')
+
+    # Release the figure, so that repeated calls do not accumulate open figures
+    plt.close(fig)
+
+def main():
+    """Simulate the closed-loop system and, unless disabled, plot the response"""
+
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--no-plot', dest='plot', action='store_false',
+                        help='simulate only, without importing matplotlib or saving figures')
+    args = parser.parse_args()
+
+    t_out, y_out = simulate()
+
+    if args.plot:
+        plot(t_out, y_out)
 
-AX_1 = FIG.add_subplot(3, 1, 1)
-AX_1.plot(T, XD_IN, label=r'$x_{d}$', color=RED)
-AX_1.plot(T_OUT, Y_OUT[0], label=r'$x$', color=BLUE)
-AX_1.set_ylabel('Motor Velocity')
-AX_1.set_xlabel(r'time ($t$)', fontname="Times New Roman", fontsize=9, fontweight=100)
-AX_1.legend(loc="lower right", bbox_to_anchor=(1, 0), fontsize=9)
-AX_1.set_facecolor(WHITE)
-
-AX_2 = FIG.add_subplot(3, 1, 2)
-AX_2.plot(T_OUT, Y_OUT[1], label=r'$\hat{J}$', color=RED)
-AX_2.plot(T_OUT, Y_OUT[2], label=r'$\hat{B}$', color=BLUE)
-AX_2.set_ylabel('Parameter Estimates')
-AX_2.set_xlabel(r'time ($t$)', fontname="Times New Roman", fontsize=9, fontweight=100)
-AX_2.legend(loc="lower right", bbox_to_anchor=(1, 0), fontsize=9)
-AX_2.set_facecolor(WHITE)
-
-AX_3 = FIG.add_subplot(3, 1, 3)
-AX_3.plot(T_OUT, Y_OUT[3], label=r'$u$', color=BLUE)
-AX_3.set_ylabel('Control Effort')
-AX_3.set_xlabel(r'time ($t$)', fontname="Times New Roman", fontsize=9, fontweight=100)
-AX_3.legend(loc="lower right", bbox_to_anchor=(1, 0), fontsize=9)
-AX_3.set_facecolor(WHITE)
-
-FIG.savefig('fig/adaptive_pi.png', bbox_inches='tight')
+if __name__ == "__main__":
+    main()
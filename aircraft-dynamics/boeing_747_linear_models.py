@@ -3,12 +3,17 @@ Boeing 747-100 linear model
 Flight condition: M = 0.9, h = 40,000ft
 Dimensional derivatives taken from NASA report CR-2144 (page 230, 234)
 Also see Nelson Appendix B Table B.27 page 416
+
+The model builders are pure and return read-only matrices, which are either computed
+once at import or cached on first call
 """
 
+import argparse
+from functools import lru_cache
+import math
+import os
 import control
 import numpy as np
-from numpy.linalg import inv
-import matplotlib.pyplot as plt
 
 # Gravity [ft/s^2]
 G = 32.3
@@ -68,6 +73,26 @@ Z_ALPHA = Z_W * V_EQ
 M_ALPHA = M_W * V_EQ
 M_ALPHA_DOT = M_W_DOT * V_EQ
 
+# Effective derivatives that appear in the explicit state-space forms, folded once
+# here so that the model builders only pack precomputed constants
+# Each holds the product its name describes, and any sign or offset is written where it
+# is packed, so the matrix entries read as in Nelson
+_M_U_EFF = M_U + M_W_DOT * Z_U
+_M_W_EFF = M_W + M_W_DOT * Z_W
+_M_Q_EFF = M_Q + M_W_DOT * U_EQ
+_M_DTH_EFF = M_D_TH + M_W_DOT * Z_D_TH
+_M_DE_EFF = M_D_E + M_W_DOT * Z_D_E
+_Z_V_V = Z_V / V_EQ
+_Z_A_V = Z_ALPHA / V_EQ
+_Z_Q_V = Z_Q / V_EQ
+_Z_DE_V = Z_D_E / V_EQ
+_M_ALPHA_EFF = M_ALPHA + M_ALPHA_DOT * _Z_A_V
+_M_Q_ALPHA_EFF = M_Q + M_ALPHA_DOT
+_G_COS_GAMMA = G * np.cos(GAMMA_EQ)
+_G_SIN_GAMMA_V = G * np.sin(GAMMA_EQ) / V_EQ
+_X_DTH_COS_ALPHA = X_D_TH * np.cos(ALPHA_EQ)
+_X_DTH_SIN_ALPHA = X_D_TH * np.sin(ALPHA_EQ)
+
 # Lateral stability derivatives
 # Y
 Y_V = -0.0605
@@ -133,6 +158,69 @@ B_P_PRIME_LATR = np.array([
     [N_D_A, N_D_R],
     [0, 0]])
 
+def _read_only(matrices):
+    """Mark model matrices read-only so that cached models cannot be modified"""
+
+    for matrix in matrices:
+        matrix.setflags(write=False)
+
+    return tuple(matrices)
+
+# Longitudinal matrices augmented with altitude
+E_P_LONG_5 = np.zeros((5, 5))
+E_P_LONG_5[:4, :4] = E_P_LONG
+E_P_LONG_5[4, 4] = 1
+
+A_P_PRIME_LONG_5 = np.zeros((5, 5))
+A_P_PRIME_LONG_5[:4, :4] = A_P_PRIME_LONG
+A_P_PRIME_LONG_5[4, 1] = -1
+A_P_PRIME_LONG_5[4, 3] = U_EQ
+
+B_P_PRIME_LONG_5 = np.zeros((5, 2))
+B_P_PRIME_LONG_5[:4] = B_P_PRIME_LONG
+
+# Lateral-directional matrices augmented with heading angle
+E_P_LATR_5 = np.zeros((5, 5))
+E_P_LATR_5[:4, :4] = E_P_LATR
+E_P_LATR_5[4, 4] = 1
+
+A_P_PRIME_LATR_5 = np.zeros((5, 5))
+A_P_PRIME_LATR_5[:4, :4] = A_P_PRIME_LATR
+A_P_PRIME_LATR_5[4, 2] = 1
+
+B_P_PRIME_LATR_5 = np.zeros((5, 2))
+B_P_PRIME_LATR_5[:4] = B_P_PRIME_LATR
+
+# The body-axis models E^{-1} A' and E^{-1} B' depend only on constants, so solve for
+# them once at import with a single batched solve of E [A B] = [A' B'] for both axes
+E_BATCH = np.stack((E_P_LONG_5, E_P_LATR_5))
+AB_PRIME_BATCH = np.stack((
+    np.hstack((A_P_PRIME_LONG_5, B_P_PRIME_LONG_5)),
+    np.hstack((A_P_PRIME_LATR_5, B_P_PRIME_LATR_5))))
+AB_BATCH = np.linalg.solve(E_BATCH, AB_PRIME_BATCH)
+
+A_LONG_5A = AB_BATCH[0, :, :5].copy()
+B_LONG_5A = AB_BATCH[0, :, 5:].copy()
+
+# The altitude augmentation leaves E block diagonal, so the 4-state model is a sub-block
+A_LONG_4 = A_LONG_5A[:4, :4].copy()
+B_LONG_4 = B_LONG_5A[:4].copy()
+
+A_LATR_5 = AB_BATCH[1, :, :5].copy()
+B_LATR_5 = AB_BATCH[1, :, 5:].copy()
+
+_LONGITUDINAL_BODY_4 = _read_only([
+    A_LONG_4, B_LONG_4, np.identity(4), np.zeros((4,2)), np.array([[0, 0, 1, 0]]), np.zeros((1,2))])
+
+_LONGITUDINAL_BODY_5A = _read_only([
+    A_LONG_5A, B_LONG_5A, np.identity(5), np.zeros((5,2)), np.array([[0, 0, 1, 0, 0]]),
+    np.zeros((1,2))])
+
+_LATERAL_BODY_5 = _read_only([
+    A_LATR_5, B_LATR_5, np.identity(5), np.zeros((5,2)), np.array([0, 1, 0, 0, 0]),
+    np.zeros((1,1))])
+
+
 def boeing_747_linear_longitudinal_body_4():
     """
     Boeing 747 longitudinal dynamics
@@ -143,19 +231,7 @@ def boeing_747_linear_longitudinal_body_4():
     E \dot{x} = A^{prime}x + B^{prime}u
     """
 
-    e_p = E_P_LONG
-    a_p_prime = A_P_PRIME_LONG
-    b_p_prime = B_P_PRIME_LONG
-
-    a_p = np.matmul(inv(e_p), a_p_prime)
-    b_p = np.matmul(inv(e_p), b_p_prime)
-    c_p = np.identity(4)
-    d_p = np.zeros((4,2))
-
-    c_pz = np.array([[0, 0, 1, 0]])
-    d_pz = np.zeros((1,2))
-
-    return [a_p, b_p, c_p, d_p, c_pz, d_pz]
+    return _LONGITUDINAL_BODY_4
 
 def boeing_747_linear_longitudinal_body_5a():
     """
@@ -169,26 +245,9 @@ def boeing_747_linear_longitudinal_body_5a():
     \dot{h} = u_{eq} (\theta - w)
     """
 
-    e_p_row_1 = np.concatenate((E_P_LONG, np.array([[0, 0, 0, 0]]).T), axis=1)
-    e_p_row_2 = np.array([[0, 0, 0, 0, 1]])
-    e_p = np.concatenate((e_p_row_1, e_p_row_2), axis=0)
-
-    a_p_prime_row_1 = np.concatenate((A_P_PRIME_LONG, np.array([[0, 0, 0, 0]]).T), axis=1)
-    a_p_prime_row_2 = np.array([[0, -1, 0, U_EQ, 0]])
-    a_p_prime = np.concatenate((a_p_prime_row_1, a_p_prime_row_2), axis=0)
-
-    b_p_prime =np.concatenate((B_P_PRIME_LONG, np.array([[0, 0]])), axis=0)
-
-    a_p = np.matmul(inv(e_p), a_p_prime)
-    b_p = np.matmul(inv(e_p), b_p_prime)
-    c_p = np.identity(5)
-    d_p = np.zeros((5,2))
-
-    c_pz = np.array([[0, 0, 1, 0, 0]])
-    d_pz = np.zeros((1,2))
-
-    return [a_p, b_p, c_p, d_p, c_pz, d_pz]
+    return _LONGITUDINAL_BODY_5A
 
+@lru_cache(maxsize=1)
 def boeing_747_linear_longitudinal_body_5b():
     """
     Boeing 747 longitudinal dynamics
@@ -201,19 +260,28 @@ def boeing_747_linear_longitudinal_body_5b():
     This expression is consistent with, for example, Nelson Eq. 4.51
     """
 
-    a_p = np.array([
-        [X_U, X_W, 0, -G, 0],
-        [Z_U, Z_W, U_EQ, 0, 0],
-        [M_U + M_W_DOT * Z_U, M_W + M_W_DOT * Z_W, M_Q + M_W_DOT * U_EQ, 0, 0],
-        [0, 0, 1, 0, 0],
-        [0, -1, 0, U_EQ, 0]])
-
-    b_p = np.array([
-        [X_D_TH, X_D_E],
-        [Z_D_TH, Z_D_E],
-        [M_D_TH + M_W_DOT * Z_D_TH, M_D_E + M_W_DOT * Z_D_E],
-        [0, 0],
-        [0, 0]])
+    # Only the entries that are nonzero in general are written
+    a_p = np.zeros((5, 5))
+    a_p[0, 0] = X_U
+    a_p[0, 1] = X_W
+    a_p[0, 3] = -G
+    a_p[1, 0] = Z_U
+    a_p[1, 1] = Z_W
+    a_p[1, 2] = U_EQ
+    a_p[2, 0] = _M_U_EFF
+    a_p[2, 1] = _M_W_EFF
+    a_p[2, 2] = _M_Q_EFF
+    a_p[3, 2] = 1
+    a_p[4, 1] = -1
+    a_p[4, 3] = U_EQ
+
+    b_p = np.zeros((5, 2))
+    b_p[0, 0] = X_D_TH
+    b_p[0, 1] = X_D_E
+    b_p[1, 0] = Z_D_TH
+    b_p[1, 1] = Z_D_E
+    b_p[2, 0] = _M_DTH_EFF
+    b_p[2, 1] = _M_DE_EFF
 
     c_p = np.identity(5)
     d_p = np.zeros((5,2))
@@ -225,8 +293,9 @@ def boeing_747_linear_longitudinal_body_5b():
         [0, 0, 0, 0, 1]])
     d_pz = np.array([[0], [0], [0], [0]])
 
-    return [a_p, b_p, c_p, d_p, c_pz, d_pz]
+    return _read_only([a_p, b_p, c_p, d_p, c_pz, d_pz])
 
+@lru_cache(maxsize=1)
 def boeing_747_linear_longitudinal_stability_5():
     """
     Boeing 747 longitudinal dynamics
@@ -236,19 +305,29 @@ def boeing_747_linear_longitudinal_stability_5():
     See Lavretsky, Wise Eq. 1.17, 1.18 and Nelson 4.75
     """
 
-    a_p = np.array([
-        [X_V, X_ALPHA, 0, -G * np.cos(GAMMA_EQ), 0],
-        [Z_V / V_EQ, Z_ALPHA / V_EQ, 1 + Z_Q / V_EQ, - G * np.sin(GAMMA_EQ) / V_EQ, 0],
-        [M_V, M_ALPHA + M_ALPHA_DOT * Z_ALPHA / V_EQ, M_Q + M_ALPHA_DOT, 0, 0],
-        [0, 0, 1, 0, 0],
-        [0, -V_EQ, 0, V_EQ, 0]])
-
-    b_p = np.array([
-        [X_D_TH * np.cos(ALPHA_EQ), X_D_E],
-        [-X_D_TH * np.sin(ALPHA_EQ), Z_D_E / V_EQ],
-        [M_D_TH, M_D_E],
-        [0, 0],
-        [0, 0]])
+    # Only the entries that are nonzero in general are written
+    a_p = np.zeros((5, 5))
+    a_p[0, 0] = X_V
+    a_p[0, 1] = X_ALPHA
+    a_p[0, 3] = -_G_COS_GAMMA
+    a_p[1, 0] = _Z_V_V
+    a_p[1, 1] = _Z_A_V
+    a_p[1, 2] = 1 + _Z_Q_V
+    a_p[1, 3] = -_G_SIN_GAMMA_V
+    a_p[2, 0] = M_V
+    a_p[2, 1] = _M_ALPHA_EFF
+    a_p[2, 2] = _M_Q_ALPHA_EFF
+    a_p[3, 2] = 1
+    a_p[4, 1] = -V_EQ
+    a_p[4, 3] = V_EQ
+
+    b_p = np.zeros((5, 2))
+    b_p[0, 0] = _X_DTH_COS_ALPHA
+    b_p[0, 1] = X_D_E
+    b_p[1, 0] = -_X_DTH_SIN_ALPHA
+    b_p[1, 1] = _Z_DE_V
+    b_p[2, 0] = M_D_TH
+    b_p[2, 1] = M_D_E
 
     c_p = np.identity(5)
     d_p = np.zeros((5,2))
@@ -260,7 +339,7 @@ def boeing_747_linear_longitudinal_stability_5():
         [0, 0, 0, 0, 1]])
     d_pz = np.zeros((4,2))
 
-    return [a_p, b_p, c_p, d_p, c_pz, d_pz]
+    return _read_only([a_p, b_p, c_p, d_p, c_pz, d_pz])
 
 def boeing_747_linear_lateral_body_5():
     """
@@ -271,26 +350,9 @@ def boeing_747_linear_lateral_body_5():
     See Nelson Eq. 5.33
     """
 
-    e_latr = E_P_LATR
-    a_latr_prime = A_P_PRIME_LATR
-    b_latr_prime = B_P_PRIME_LATR
-
-    a_p_latr = np.matmul(inv(e_latr), a_latr_prime)
-    b_p_latr = np.matmul(inv(e_latr), b_latr_prime)
-
-    a_p_row_1 = np.concatenate((a_p_latr, np.array([[0, 0, 0, 0]]).T), axis=1)
-    a_p_row_2 = np.array([[0, 0, 1, 0, 0]])
-
-    # Augment with heading angle
-    a_p = np.concatenate((a_p_row_1, a_p_row_2), axis=0)
-    b_p = np.concatenate((b_p_latr, np.zeros((1,2))), axis=0)
-    c_p = np.identity(5)
-    d_p = np.zeros((5,2))
-    c_pz = np.array([0, 1, 0, 0, 0])
-    d_pz = np.zeros((1,1))
-
-    return [a_p, b_p, c_p, d_p, c_pz, d_pz]
+    return _LATERAL_BODY_5
 
+@lru_cache(maxsize=1)
 def boeing_747_linear_lateral_stability_5():
     """
     Boeing 747 lateral-directional dynamics
@@ -323,18 +385,7 @@ def boeing_747_linear_lateral_stability_5():
         [0, 0, 0, 0, 1]])
     d_pz = np.zeros((4,2))
 
-    return [a_p, b_p, c_p, d_p, c_pz, d_pz]
-
-A_P, B_P, C_P, D_P, C_PZ, D_PZ = boeing_747_linear_longitudinal_stability_5()
-
-# Define plant
-IO_PLANT = control.LinearIOSystem(
-    control.StateSpace(A_P, B_P, C_P, D_P),
-    inputs=2,
-    outputs=5,
-    states=5,
-    name='plant'
-)
+    return _read_only([a_p, b_p, c_p, d_p, c_pz, d_pz])
 
 # Set simulation duration and time steps
 N_POINTS = 6000
@@ -347,13 +398,30 @@ X0 = [[0], [2 * np.pi / 180], [0], [0], [0]]
 T = np.linspace(0, T_F, N_POINTS)
 U = np.zeros((2, N_POINTS))
 
-# Simulate the system
-T_OUT, Y_OUT = control.input_output_response(IO_PLANT, T, U, X0)
+def simulate():
+    """
+    Simulate the longitudinal stability-axis model from an initial angle of attack
+    Output: time t_out and plant output y_out = [V, alpha, q, theta, h]
+    """
 
-# Plot the response
-plt.rc('text', usetex=True)
-plt.rc('font', family='sans')
+    a_p, b_p, c_p, d_p, _, _ = boeing_747_linear_longitudinal_stability_5()
+
+    # Define plant
+    io_plant = control.LinearIOSystem(
+        control.StateSpace(a_p, b_p, c_p, d_p),
+        inputs=2,
+        outputs=5,
+        states=5,
+        name='plant'
+    )
+
+    # The plant is linear, so step the exact discretization x[k+1] = e^{A dt} x[k] + ...
+    # instead of integrating the state equation with a general ODE solver
+    t_out, y_out = control.forced_response(io_plant, T, U, X0)
 
+    return t_out, y_out
+
+# Plot the response
 # Define plot styles
 RED = '#f62d73'
 BLUE = '#1269d3'
@@ -363,36 +431,107 @@ ORANGE = '#ffa500'
 PURPLE = '#da70d6'
 GREY = '#444444'
 
-# Make figure
-FIG_1 = plt.figure(1, figsize=(6, 9), dpi=300, facecolor='w', edgecolor='k')
-
-AX_1_1 = FIG_1.add_subplot(3, 1, 1)
-AX_1_1.plot(T_OUT, Y_OUT[1], label=r'$\alpha$', color=RED)
-AX_1_1.plot(T_OUT, Y_OUT[2], label=r'$q$', color=BLUE)
-AX_1_1.plot(T_OUT, Y_OUT[3], label=r'$\theta$', color=GREEN)
-AX_1_1.set_title('Aircraft State')
-AX_1_1.set_xlabel(r'time ($t$)', fontname="Times New Roman", fontsize=9, fontweight=100)
-AX_1_1.legend(loc="upper right", bbox_to_anchor=(1, 1), fontsize=9)
-AX_1_1.set_facecolor(WHITE)
-
-AX_1_2 = FIG_1.add_subplot(3, 1, 2)
-AX_1_2.plot(T_OUT, Y_OUT[0], label=r'$V_{T}$', color=ORANGE)
-AX_1_2.plot(T_OUT, Y_OUT[4], label=r'$h$', color=PURPLE)
-AX_1_2.set_title('Aircraft State')
-AX_1_2.set_xlabel(r'time ($t$)', fontname="Times New Roman", fontsize=9, fontweight=100)
-AX_1_2.legend(loc="upper right", bbox_to_anchor=(1, 1), fontsize=9)
-AX_1_2.set_facecolor(WHITE)
-
-AX_1_3 = FIG_1.add_subplot(3, 1, 3)
-AX_1_3.plot(T_OUT, U[0], label=r'$\delta_{e}$', color=GREY)
-AX_1_3.plot(T_OUT, U[1], label=r'$\delta_{e}$', color=RED)
-AX_1_3.set_title('Control Input')
-AX_1_3.set_xlabel(r'time ($t$)', fontname="Times New Roman", fontsize=9, fontweight=100)
-AX_1_3.legend(loc="upper right", bbox_to_anchor=(1, 1), fontsize=9)
-AX_1_3.set_facecolor(WHITE)
-
-# Format figure
-FIG_1.tight_layout(rect=[0, 0.03, 1, 0.95])
-
-# Save figures
-FIG_1.savefig('fig/boeing_747_linear_longitudinal.png', bbox_inches='tight')
+FIG_SIZE = (6, 9)
+FIG_DPI = 100
+SAVE_DPI = 300
+
+def _pyplot():
+    """
+    Import and return matplotlib.pyplot with the non-interactive Agg backend
+    Deferred until plotting, so that importing the module and simulating stay cheap
+    """
+
+    # pylint: disable=import-outside-toplevel
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    return plt
+
+def init_figure():
+    """
+    Build the response figure once, returning it with its line artists
+    Lines: [alpha, q, theta, V_T, h, throttle, elevator]
+    """
+
+    plt = _pyplot()
+
+    plt.rc('text', usetex=bool(os.environ.get('PUBLISH')))
+    plt.rc('font', family='sans')
+
+    fig = plt.figure(figsize=FIG_SIZE, dpi=FIG_DPI, facecolor='w', edgecolor='k')
+
+    ax_1 = fig.add_subplot(3, 1, 1)
+    lines = [
+        ax_1.plot([], [], label=r'$\alpha$', color=RED)[0],
+        ax_1.plot([], [], label=r'$q$', color=BLUE)[0],
+        ax_1.plot([], [], label=r'$\theta$', color=GREEN)[0]
+        ]
+    ax_1.set_title('Aircraft State')
+
+    ax_2 = fig.add_subplot(3, 1, 2)
+    lines += [
+        ax_2.plot([], [], label=r'$V_{T}$', color=ORANGE)[0],
+        ax_2.plot([], [], label=r'$h$', color=PURPLE)[0]
+        ]
+    ax_2.set_title('Aircraft State')
+
+    ax_3 = fig.add_subplot(3, 1, 3)
+    lines += [
+        ax_3.plot([], [], label=r'$\delta_{e}$', color=GREY)[0],
+        ax_3.plot([], [], label=r'$\delta_{e}$', color=RED)[0]
+        ]
+    ax_3.set_title('Control Input')
+
+    for ax in (ax_1, ax_2, ax_3):
+        ax.set_xlabel(r'time ($t$)', fontname="Times New Roman", fontsize=9, fontweight=100)
+        ax.legend(loc="upper right", bbox_to_anchor=(1, 1), fontsize=9)
+        ax.set_facecolor(WHITE)
+
+    return fig, lines
+
+def update_figure(lines, t_out, y_out, u_in):
+    """Replace the data of the figure lines with a new response and rescale the axes"""
+
+    # Downsample to at most two samples per horizontal pixel of the saved figure
+    step = math.ceil(len(t_out) / (2 * FIG_SIZE[0] * SAVE_DPI))
+
+    rows = (y_out[1], y_out[2], y_out[3], y_out[0], y_out[4], u_in[0], u_in[1])
+    for line, y_line in zip(lines, rows):
+        line.set_data(t_out[::step], y_line[::step])
+
+    for ax in {line.axes for line in lines}:
+        ax.relim()
+        ax.autoscale_view()
+
+def plot(t_out, y_out, u_in=U):
+    """Plot the response and save the figure"""
+
+    plt = _pyplot()
+
+    fig, lines = init_figure()
+    update_figure(lines, t_out, y_out, u_in)
+
+    # Format figure once the axes hold the response
+    fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+    fig.savefig('boeing_747_linear_longitudinal.png', dpi=SAVE_DPI, bbox_inches='tight')
+
+    # Release the figure, so that repeated calls do not accumulate open figures
+    plt.close(fig)
+
+def main():
+    """Simulate the longitudinal model and, unless disabled, plot the response"""
+
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--no-plot', dest='plot', action='store_false',
+                        help='simulate only, without importing matplotlib or saving figures')
+    args = parser.parse_args()
+
+    t_out, y_out = simulate()
+
+    if args.plot:
+        plot(t_out, y_out)
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@
 Classical MIMO Adaptive Control
 """
 
+import os
 import control
 import numpy as np
 import matplotlib.pyplot as plt
@@ -33,17 +34,13 @@ IO_PLANT = control.LinearIOSystem(
 # Stable Hermite form
 A = 1
 
-# # Reference Model
-NUM_WM = [[np.array([0]) for i in range(2)] for j in range(2)]
-DEN_WM = [[np.array([1]) for i in range(2)] for j in range(2)]
-
-NUM_WM[0][0] = np.array([A])
-DEN_WM[0][0] = np.array([1., A])
-NUM_WM[1][1] = np.array([A])
-DEN_WM[1][1] = np.array([1., A])
-
+# Reference model
+# input: r
+# state: x_m
+# output: y_m
+# W_m(s) = A / (s + A) on each channel
 IO_REF_MODEL = control.LinearIOSystem(
-    control.tf2ss(NUM_WM, DEN_WM),
+    control.StateSpace(-A * np.identity(2), A * np.identity(2), np.identity(2), np.zeros((2, 2))),
     inputs=2,
     outputs=2,
     states=2,
@@ -53,100 +50,104 @@ IO_REF_MODEL = control.LinearIOSystem(
 # Filter
 R_Q = np.array([1., 1., 1.])
 
-# Input filters
-NUM_IN = [[np.array([0]) for j in range(2)] for i in range(4)]
-DEN_IN = [[np.array([1]) for j in range(2)] for i in range(4)]
+def filter_bank(r_q, orders, n_inputs=2):
+    """
+    Controllable canonical realization of the diagonal filters s^k / R_Q(s)
+    Each input drives its own filter state [z, z_dot] with R_Q(s) z = u, and for each
+    order k in orders (0, 1, or 2) the outputs s^k z of every input are stacked in turn
+    """
+
+    # Companion form of the second order filter 1 / R_Q(s) of a single input
+    a_f = np.array([[0., 1.], [-r_q[2] / r_q[0], -r_q[1] / r_q[0]]])
+    b_f = np.array([[0.], [1. / r_q[0]]])
 
-NUM_IN[0][0] = np.array([1.])
-DEN_IN[0][0] = R_Q
-NUM_IN[1][1] = np.array([1.])
-DEN_IN[1][1] = R_Q
+    # Outputs z, z_dot, and z_ddot of a single filter
+    c_f = np.vstack((np.identity(2), a_f[1]))
+    d_f = np.vstack((np.zeros((2, 1)), b_f[1]))
 
-NUM_IN[2][0] = np.array([1., 0.])
-DEN_IN[2][0] = R_Q
-NUM_IN[3][1] = np.array([1., 0.])
-DEN_IN[3][1] = R_Q
+    eye = np.identity(n_inputs)
+
+    return control.StateSpace(
+        np.kron(eye, a_f),
+        np.kron(eye, b_f),
+        np.vstack([np.kron(eye, c_f[k]) for k in orders]),
+        np.vstack([np.kron(eye, d_f[k]) for k in orders]))
 
 # Define input filters
 # input: u
-# outputs: omega_1, omega_2
+# outputs: omega_1 = u / R_Q(s), omega_2 = s u / R_Q(s)
 IO_INPUT_FILTER = control.LinearIOSystem(
-    control.tf2ss(NUM_IN, DEN_IN),
+    filter_bank(R_Q, (0, 1)),
     inputs=2,
     outputs=4,
     states=4,
     name='input_filter'
 )
 
-# Output filters
-NUM_OUT = [[np.array([0]) for j in range(2)] for i in range(6)]
-DEN_OUT = [[np.array([1]) for j in range(2)] for i in range(6)]
-
-NUM_OUT[0][0] = np.array([1.])
-DEN_OUT[0][0] = R_Q
-NUM_OUT[1][1] = np.array([1.])
-DEN_OUT[1][1] = R_Q
-
-NUM_OUT[2][0] = np.array([1., 0.])
-DEN_OUT[2][0] = R_Q
-NUM_OUT[3][1] = np.array([1., 0.])
-DEN_OUT[3][1] = R_Q
-
-NUM_OUT[4][0] = np.array([1., 0., 0.])
-DEN_OUT[4][0] = R_Q
-NUM_OUT[5][1] = np.array([1., 0., 0.])
-DEN_OUT[5][1] = R_Q
-
 # Define output filters
 # input: y_p
-# outputs: omega_3, omega_4, omega_5
+# outputs: omega_3 = y_p / R_Q(s), omega_4 = s y_p / R_Q(s), omega_5 = s^2 y_p / R_Q(s)
 IO_OUTPUT_FILTER = control.LinearIOSystem(
-    control.tf2ss(NUM_OUT, DEN_OUT),
+    filter_bank(R_Q, (0, 1, 2)),
     inputs=2,
     outputs=6,
     states=4,
     name='output_filter'
 )
 
-def adaptive_state(_t, x_state, u_input, _params):
-    """Internal state of adpative controller"""
+def _adapt_state(u_c):
+    """
+    Update laws of adaptive controller
+    Input: controller input u_c = [omega[12], y_p[2], y_m[2]] as a list of floats
+    Output: Theta_dot[12] as a list of floats
+    """
 
     # Algebraic Relationships: error: e_1 = y_p - y_m
-    e_1_1 = u_input[12] - u_input[14]
-    e_1_2 = u_input[13] - u_input[15]
+    e_1_1 = u_c[12] - u_c[14]
+    e_1_2 = u_c[13] - u_c[15]
 
     # Dynamics: update laws
     return [
-        -e_1_1 * u_input[0],
-        -e_1_2 * u_input[1],
-        -e_1_1 * u_input[2],
-        -e_1_2 * u_input[3],
-        -e_1_1 * u_input[4],
-        -e_1_2 * u_input[5],
-        -e_1_1 * u_input[6],
-        -e_1_2 * u_input[7],
-        -e_1_1 * u_input[8],
-        -e_1_2 * u_input[9],
-        -e_1_1 * u_input[10],
-        -e_1_2 * u_input[11]
+        -e_1_1 * u_c[0],
+        -e_1_2 * u_c[1],
+        -e_1_1 * u_c[2],
+        -e_1_2 * u_c[3],
+        -e_1_1 * u_c[4],
+        -e_1_2 * u_c[5],
+        -e_1_1 * u_c[6],
+        -e_1_2 * u_c[7],
+        -e_1_1 * u_c[8],
+        -e_1_2 * u_c[9],
+        -e_1_1 * u_c[10],
+        -e_1_2 * u_c[11]
         ]
 
-def adaptive_output(_t, x_state, u_input, _params):
-    """Algebraic output from adaptive controller"""
-
-    # Define Theta and omega
-    theta_1 = [x_state[0], x_state[2], x_state[4], x_state[6], x_state[8], x_state[10]]
-    theta_2 = [x_state[1], x_state[3], x_state[5], x_state[7], x_state[9], x_state[11]]
-    omega_1 = [u_input[0], u_input[2], u_input[4], u_input[6], u_input[8], u_input[10]]
-    omega_2 = [u_input[1], u_input[3], u_input[5], u_input[7], u_input[9], u_input[11]]
+def _adapt_out(x_c, u_c):
+    """
+    Control law of adaptive controller
+    Input: controller state x_c = Theta[12] and input u_c as lists of floats
+    Output: u[2] as a list of floats
+    """
 
     # Control law
     # u = Theta * omega
     return [
-        sum([a*b for a, b in zip(theta_1, omega_1)]),
-        sum([a*b for a, b in zip(theta_2, omega_2)])
+        x_c[0] * u_c[0] + x_c[2] * u_c[2] + x_c[4] * u_c[4]
+        + x_c[6] * u_c[6] + x_c[8] * u_c[8] + x_c[10] * u_c[10],
+        x_c[1] * u_c[1] + x_c[3] * u_c[3] + x_c[5] * u_c[5]
+        + x_c[7] * u_c[7] + x_c[9] * u_c[9] + x_c[11] * u_c[11]
         ]
 
+def adaptive_state(_t, x_state, u_input, _params):
+    """Internal state of adpative controller"""
+
+    return _adapt_state(u_input.tolist())
+
+def adaptive_output(_t, x_state, u_input, _params):
+    """Algebraic output from adaptive controller"""
+
+    return _adapt_out(x_state.tolist(), u_input.tolist())
+
 IO_ADAPTIVE = control.NonlinearIOSystem(
     adaptive_state,
     adaptive_output,
@@ -199,15 +200,12 @@ X0 = np.zeros((27, 1))
 T = np.linspace(0, T_F, N_POINTS)
 U = np.zeros((4, N_POINTS))
 
-R_IN_1 = np.zeros(N_POINTS)
-R_IN_1[1000:2000] = 1
-R_IN_1[3000:4000] = 1
-R_IN_1[5000:6000] = 1
-
-R_IN_2 = np.zeros(N_POINTS)
-R_IN_2[1000:2000] = -1
-R_IN_2[3000:4000] = -1
-R_IN_2[5000:6000] = -1
+# The references are opposite pulse trains, holding each level for an equal span
+# R_LEVELS[i] is held from sample R_BREAKPOINTS[i], for any number of samples
+R_LEVELS = np.array([0., 1., 0., 1., 0., 1.])
+R_BREAKPOINTS = T[np.arange(R_LEVELS.size) * N_POINTS // R_LEVELS.size]
+R_IN_1 = R_LEVELS[np.searchsorted(R_BREAKPOINTS, T, side='right') - 1]
+R_IN_2 = -R_IN_1
 
 U[0, :] = R_IN_1
 U[1, :] = R_IN_2
@@ -218,7 +216,7 @@ U[3, :] = R_IN_2
 T_OUT, Y_OUT = control.input_output_response(IO_CLOSED, T, U, X0)
 
 # Plot the response
-plt.rc('text', usetex=True)
+plt.rc('text', usetex=bool(os.environ.get('PUBLISH')))
 plt.rc('font', family='sans')
 
 # Define plot styles
@@ -226,9 +224,11 @@ RED = '#f62d73'
 BLUE = '#1269d3'
 WHITE = '#ffffff'
 GREEN = '#2df643'
+FIG_DPI = 100
+SAVE_DPI = 300
 
 # Make figure
-FIG_1 = plt.figure(1, figsize=(6, 6), dpi=300, facecolor='w', edgecolor='k')
+FIG_1 = plt.figure(1, figsize=(6, 6), dpi=FIG_DPI, facecolor='w', edgecolor='k')
 
 AX_1_1 = FIG_1.add_subplot(2, 1, 1)
 AX_1_1.plot(T_OUT, R_IN_1, label=r'$r_{1}$', color=RED)
@@ -252,4 +252,4 @@ AX_1_2.set_facecolor(WHITE)
 FIG_1.tight_layout(rect=[0, 0.03, 1, 0.95])
 
 # Save figures
-FIG_1.savefig('fig/classical_mimo_output.png', bbox_inches='tight')
+FIG_1.savefig('fig/classical_mimo_output.png', dpi=SAVE_DPI, bbox_inches='tight')
@@ -2,15 +2,21 @@
 This example shows reference model adaptive control of a simple, scalar system.
 A closed-loop reference model is used, and the tuning gain and CRM gain can be
 varied and the resulting closed-loop performance to a simple step command.
+
+The plant, reference model, and controller are collapsed into a single four-state
+vector field. The closed-loop systems for all pairs of gains are stacked into one ODE
+which is integrated directly with LSODA in a single solve.
 """
 
-import control
+import os
 import numpy as np
-import matplotlib.pyplot as plt
+from scipy.integrate import odeint
 
 # Gains
-L = -100
-GAMMA = 100
+# One closed-loop system is simulated for each (GAMMA, L) pair
+GAMMA = np.array([100, 100, 100, 100, 10, 10, 1])
+L = -np.array([0, 10, 100, 1000, 0, 10, 0])
+N_SYSTEMS = GAMMA.size
 
 # Plant parameters
 # input: u
@@ -27,62 +33,73 @@ D_P = 0
 # output: x_m
 K_M = 1
 A_M = -1
-B_M = np.array([K_M, -L])
+B_M = np.array([np.full(N_SYSTEMS, K_M), -L])
 C_M = 1
 D_M = 0
 
+# Loop-invariant terms of the closed-loop dynamics
+_SIGN_B_P = float(np.sign(B_P))
+_GAMMA_SIGN_B_P = GAMMA * _SIGN_B_P
+_A_M_L = A_M + L
+
 # Initial conditions
 X_M_0 = 0
 X_P_0 = 0
 THETA_0 = 0
 K_0 = 0
 
-# Define plant
-IO_PLANT = control.LinearIOSystem(
-    control.StateSpace(A_P, B_P, C_P, D_P),
-    inputs=('u'),
-    outputs=('x_p'),
-    states=('x_p'),
-    name='plant'
-)
-
-# Define reference model
-IO_REF_MODEL = control.LinearIOSystem(
-    control.StateSpace(A_M + L, B_M, C_M, D_M),
-    inputs=('r', 'x_p'),
-    outputs=('x_m'),
-    states=('x_m'),
-    name='ref_model'
-)
-
-def adaptive_state(_t, x_state, u_input, _params):
-    """Internal state of adpative controller"""
-
-    # Controller inputs
-    r = u_input[0]
-    x_p = u_input[1]
-    x_m = u_input[2]
+def reference(t):
+    """Piecewise constant reference command r, taking R_VALUES[i] from R_BREAKPOINTS[i]"""
+
+    return R_VALUES[np.searchsorted(R_BREAKPOINTS, t, side='right') - 1]
+
+def orm_versus_crm_closed_loop(t, x_batch):
+    """
+    Closed-loop dynamics of plant, reference model, and adaptive controller
+    The flattened state x_batch holds the four closed-loop states of each system in
+    turn, so the Jacobian of the stacked ODE is banded
+    """
+
+    # Closed-loop state of each system
+    x_cl = x_batch.reshape(N_SYSTEMS, 4).T
+    x_p = x_cl[0]
+    x_m = x_cl[1]
+    theta = x_cl[2]
+    k = x_cl[3]
+
+    # Reference command
+    r = reference(t)
 
     # Algebraic relationships
     e = x_p - x_m
 
-    # Dynamics
-    dot_theta = -GAMMA * np.sign(B_P) * e * x_p
-    dot_k = -GAMMA * np.sign(B_P) * e * r
+    # Control law
+    u = theta * x_p + k * r
 
-    return [dot_theta, dot_k]
+    # Dynamics: plant and reference model
+    dot_x_p = A_P * x_p + B_P * u
+    dot_x_m = _A_M_L * x_m + B_M[0] * r + B_M[1] * x_p
 
-def adaptive_output(_t, x_state, u_input, _params):
-    """Algebraic output from adaptive controller"""
+    # Dynamics: update laws
+    dot_theta = -_GAMMA_SIGN_B_P * e * x_p
+    dot_k = -_GAMMA_SIGN_B_P * e * r
 
-    # Controller inputs
-    r = u_input[0]
-    x_p = u_input[1]
-    x_m = u_input[2]
+    return np.array([dot_x_p, dot_x_m, dot_theta, dot_k]).T.ravel()
 
-    # Controller state
-    theta = x_state[0]
-    k = x_state[1]
+def orm_versus_crm_output(t, x_cl):
+    """
+    Closed-loop outputs, accepting states of shape (4, N_SYSTEMS, k)
+    Output: [x_p, x_m, u, theta, k, e], each of shape (N_SYSTEMS, k)
+    """
+
+    # Closed-loop state
+    x_p = x_cl[0]
+    x_m = x_cl[1]
+    theta = x_cl[2]
+    k = x_cl[3]
+
+    # Reference command
+    r = reference(t)
 
     # Algebraic relationships
     e = x_p - x_m
@@ -90,83 +107,123 @@ def adaptive_output(_t, x_state, u_input, _params):
     # Control law
     u = theta * x_p + k * r
 
-    return [u, theta, k, e]
-
-IO_ADAPTIVE = control.NonlinearIOSystem(
-    adaptive_state,
-    adaptive_output,
-    inputs=3,
-    outputs=('u', 'theta', 'k', 'e'),
-    states=2,
-    name='control',
-    dt=0
-)
-
-# Define the closed-loop system
-# x_cl = [plant.x_p, ref_model.x_m, control.theta, control.k]
-IO_CLOSED = control.InterconnectedSystem(
-    (IO_PLANT, IO_REF_MODEL, IO_ADAPTIVE),
-    connections=(
-        ('plant.u', 'control.u'),
-        ('ref_model.x_p', 'plant.x_p'),
-        ('control.u[1]', 'plant.x_p'),
-        ('control.u[2]', 'ref_model.x_m')
-    ),
-    inplist=('ref_model.r', 'control.u[0]'),
-    outlist=('plant.x_p', 'ref_model.x_m', 'control.u', 'control.theta', 'control.k', 'control.e'),
-    dt=0
-)
+    return np.array([C_P * x_p, C_M * x_m, u, theta, k, e])
 
 # Set simulation duration and time steps
 N_POINTS = 3000
 T_F = 30
 
+# Set integrator tolerances: absolute only
+RTOL = 0
+ATOL = 1e-6
+
 # Set initial conditions
-X0 = np.zeros((4, 1))
+X0 = np.zeros((4, N_SYSTEMS))
 X0[0] = X_P_0
 X0[1] = X_M_0
 X0[2] = THETA_0
 X0[3] = K_0
 
-# Define simulation time span and control input
+# Define simulation time span and reference command
 T = np.linspace(0, T_F, N_POINTS)
-U = np.zeros((2, N_POINTS))
-R_IN = np.zeros(N_POINTS)
-R_IN[500:N_POINTS] = 1
-U[0, :] = R_IN
-U[1, :] = R_IN
-
-# Simulate the system
-T_OUT, Y_OUT = control.input_output_response(IO_CLOSED, T, U, X0)
+# The reference is a unit step at the 500th sample, stored only by its breakpoints
+R_BREAKPOINTS = T[[0, 500]]
+R_VALUES = np.array([0., 1.])
+
+def simulate():
+    """
+    Simulate the closed-loop systems for all pairs of gains together
+    Output: time t_out and closed-loop outputs y_out = [x_p, x_m, u, theta, k, e] of
+    shape (6, N_SYSTEMS, N_POINTS)
+    """
+
+    # The step command is resolved by LSODA through tcrit, so the solver does not step
+    # over it from the initial equilibrium
+    # Each system only couples its own four states, so the Jacobian has bandwidth 3
+    x_out = odeint(
+        orm_versus_crm_closed_loop,
+        X0.T.ravel(),
+        T,
+        tfirst=True,
+        rtol=RTOL,
+        atol=ATOL,
+        tcrit=R_BREAKPOINTS[1:],
+        ml=3,
+        mu=3
+    ).reshape(N_POINTS, N_SYSTEMS, 4).transpose(2, 1, 0)
+
+    return T, orm_versus_crm_output(T, x_out)
 
 # Plot the response
-plt.rc('text', usetex=True)
-plt.rc('font', family='sans')
-
-FIG = plt.figure(1, figsize=(6, 3), dpi=300, facecolor='w', edgecolor='k')
-FIG.suptitle(r'$\gamma = $' + str(GAMMA) + r'$, \ell = $' + str(L), fontsize=12)
-
 RED = '#f62d73'
 BLUE = '#1269d3'
 WHITE = '#ffffff'
 GREEN = '#2df643'
-
-AX_1 = FIG.add_subplot(1, 2, 1)
-AX_1.plot(T_OUT, R_IN, label=r'$r$', color=RED)
-AX_1.plot(T_OUT, Y_OUT[1], label=r'$x_m$', color=BLUE)
-AX_1.plot(T_OUT, Y_OUT[0], label=r'$x_p$', color=GREEN)
-AX_1.set_title('Plant and Reference Model States')
-AX_1.set_xlabel(r'time ($t$)', fontname="Times New Roman", fontsize=9, fontweight=100)
-AX_1.legend(loc="lower right", bbox_to_anchor=(1, 0), fontsize=9)
-AX_1.set_facecolor(WHITE)
-
-AX_2 = FIG.add_subplot(1, 2, 2)
-AX_2.plot(T_OUT, Y_OUT[3], label=r'$\theta$', color=BLUE)
-AX_2.plot(T_OUT, Y_OUT[4], label=r'$k$', color=GREEN)
-AX_2.set_title('Parameter Estimates')
-AX_2.set_xlabel(r'time ($t$)', fontname="Times New Roman", fontsize=9, fontweight=100)
-AX_2.legend(loc="lower right", bbox_to_anchor=(1, 0), fontsize=9)
-AX_2.set_facecolor(WHITE)
-
-FIG.tight_layout(rect=[0, 0.03, 1, 0.95])
-FIG.savefig('fig/orm_versus_crm_gamma_' + str(GAMMA) + '_ell_' + str(-L) + '.png', bbox_inches='tight')
+FIG_DPI = 100
+SAVE_DPI = 300
+
+def _pyplot():
+    """
+    Import and return matplotlib.pyplot with the non-interactive Agg backend
+    Deferred until plotting, so that importing the module and simulating stay cheap
+    """
+
+    # pylint: disable=import-outside-toplevel
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    return plt
+
+def plot_response(t_out, r_in, y_out, gamma, crm_gain):
+    """Plot and save the closed-loop response for a single pair of gains"""
+
+    plt = _pyplot()
+
+    fig = plt.figure(figsize=(6, 3), dpi=FIG_DPI, facecolor='w', edgecolor='k')
+    fig.suptitle(r'$\gamma = $' + str(gamma) + r'$, \ell = $' + str(crm_gain), fontsize=12)
+
+    ax_1 = fig.add_subplot(1, 2, 1)
+    ax_1.plot(t_out, r_in, label=r'$r$', color=RED)
+    ax_1.plot(t_out, y_out[1], label=r'$x_m$', color=BLUE)
+    ax_1.plot(t_out, y_out[0], label=r'$x_p$', color=GREEN)
+    ax_1.set_title('Plant and Reference Model States')
+    ax_1.set_xlabel(r'time ($t$)', fontname="Times New Roman", fontsize=9, fontweight=100)
+    ax_1.legend(loc="lower right", bbox_to_anchor=(1, 0), fontsize=9)
+    ax_1.set_facecolor(WHITE)
+
+    ax_2 = fig.add_subplot(1, 2, 2)
+    ax_2.plot(t_out, y_out[3], label=r'$\theta$', color=BLUE)
+    ax_2.plot(t_out, y_out[4], label=r'$k$', color=GREEN)
+    ax_2.set_title('Parameter Estimates')
+    ax_2.set_xlabel(r'time ($t$)', fontname="Times New Roman", fontsize=9, fontweight=100)
+    ax_2.legend(loc="lower right", bbox_to_anchor=(1, 0), fontsize=9)
+    ax_2.set_facecolor(WHITE)
+
+    fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+    fig.savefig(
+        'fig/orm_versus_crm_gamma_' + str(gamma) + '_ell_' + str(-crm_gain) + '.png',
+        dpi=SAVE_DPI,
+        bbox_inches='tight')
+    plt.close(fig)
+
+def plot(t_out, y_out):
+    """Plot and save the closed-loop responses for all pairs of gains"""
+
+    plt = _pyplot()
+
+    plt.rc('text', usetex=bool(os.environ.get('PUBLISH')))
+    plt.rc('font', family='sans')
+
+    r_in = reference(t_out)
+    for i_system in range(N_SYSTEMS):
+        plot_response(t_out, r_in, y_out[:, i_system], GAMMA[i_system], L[i_system])
+
+def run():
+    """Simulate the closed-loop systems and plot their responses"""
+
+    t_out, y_out = simulate()
+    plot(t_out, y_out)
+
+if __name__ == "__main__":
+    run()
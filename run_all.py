@@ -0,0 +1,50 @@
+"""
+Run the scalar adaptive control examples concurrently
+
+Each example is an independent simulation, so they are run in a pool of worker
+processes. Each worker loads the example script from its directory and calls its run
+function there, so the figures are saved to the same place as when running the script
+directly.
+
+The examples run with the parameters set in their scripts, and run() takes no arguments.
+Gain sweeps stay within a script, as orm_versus_crm does by stacking all of its (GAMMA, L)
+pairs into one ODE, so the pool parallelizes across the scripts only.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import importlib.util
+import os
+
+# Directory of this script, resolved before any worker changes directory
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Example scripts, relative to ROOT
+EXAMPLES = (
+    'orm-versus-crm/orm_versus_crm.py',
+    'saturation-protection/saturation_protection.py',
+    'sigma-mod/sigma_mod.py'
+)
+
+def run_example(path):
+    """Load an example script by path and run it from its own directory"""
+
+    path = os.path.join(ROOT, path)
+    os.chdir(os.path.dirname(path))
+
+    module_name = os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.run()
+
+    return path
+
+def main():
+    """Run all examples in a pool of worker processes"""
+
+    with ProcessPoolExecutor(max_workers=min(len(EXAMPLES), os.cpu_count() or 1)) as executor:
+        for path in executor.map(run_example, EXAMPLES):
+            print('Finished ' + os.path.relpath(path, ROOT))
+
+if __name__ == "__main__":
+    main()
@@ -7,11 +7,15 @@ this from happening, although it doesn't provide convergence of the tracking err
 zero.
 
 See Stable Adaptive Systems Anuradha M. Annaswamy and Kumpati S. Narendra, 2005 (page 310)
+
+The plant, reference model, and controller are collapsed into a single three-state
+vector field which is integrated directly with LSODA.
 """
 
-import control
+from bisect import bisect_right
+import os
 import numpy as np
-import matplotlib.pyplot as plt
+from scipy.integrate import odeint
 
 # Plant parameters
 # input: [u, v]
@@ -45,137 +49,167 @@ THETA_0 = THETA_TILDE_0 + THETA_STAR
 X_M_0 = 0
 X_P_0 = E_0 + X_M_0
 
-# Define plant
-IO_PLANT = control.LinearIOSystem(
-    control.StateSpace(A_P, B_P, C_P, D_P),
-    inputs=('u', 'v'),
-    outputs=('x_p'),
-    states=('x_p'),
-    name='plant'
-)
-
-# Define reference model
-IO_REF_MODEL = control.LinearIOSystem(
-    control.StateSpace(A_M, B_M, C_M, D_M),
-    inputs=('r'),
-    outputs=('x_m'),
-    states=('x_m'),
-    name='ref_model'
-)
-
-def adaptive_state(_t, x_state, u_input, _params):
-    """Internal state of adpative controller"""
-
-    # Controller inputs
-    x_p = u_input[1]
-    x_m = u_input[2]
-
-    # Controller state
-    theta = x_state[0]
+def reference(t):
+    """Piecewise constant reference command r, taking R_VALUES[i] from R_BREAKPOINTS[i]"""
 
-    # Algebraic relationships
-    e = x_p - x_m
+    return R_VALUES[np.searchsorted(R_BREAKPOINTS, t, side='right') - 1]
+
+def make_sigma_mod_closed_loop():
+    """
+    Closed-loop dynamics of plant, reference model, and adaptive controller
+    The module parameters are folded into closure constants once and each call works on
+    Python floats, with the reference looked up by bisection, so a solver step pays no
+    NumPy dispatch
+    """
+
+    a_p = float(A_P)
+    b_p_u = float(B_P[0])
+    b_p_v = float(B_P[1] * V)
+    a_m = float(A_M)
+    b_m = float(B_M)
+    sigma = float(SIGMA)
+    r_breakpoints = R_BREAKPOINTS.tolist()
+    r_values = R_VALUES.tolist()
+
+    def closed_loop(t, x_cl):
+        """Closed-loop dynamics of plant, reference model, and adaptive controller"""
+
+        # Closed-loop state
+        x_p, x_m, theta = x_cl.tolist()
 
-    # Dynamics
-    dot_theta = -e * x_p - SIGMA * theta
+        # Reference command
+        r = r_values[bisect_right(r_breakpoints, t) - 1]
 
-    return [dot_theta]
+        # Algebraic relationships
+        e = x_p - x_m
 
-def adaptive_output(_t, x_state, u_input, _params):
-    """Algebraic output from adaptive controller"""
+        # Control law, with the constant bias v = V folded into b_p_v
+        u = theta * x_p + r
 
-    # Controller inputs
-    r = u_input[0]
-    x_p = u_input[1]
-    x_m = u_input[2]
+        # Dynamics: plant and reference model
+        dot_x_p = a_p * x_p + b_p_u * u + b_p_v
+        dot_x_m = a_m * x_m + b_m * r
 
-    # Controller state
-    theta = x_state[0]
+        # Dynamics: update law
+        dot_theta = -e * x_p - sigma * theta
+
+        return [dot_x_p, dot_x_m, dot_theta]
+
+    return closed_loop
+
+def sigma_mod_output(t, x_cl):
+    """
+    Closed-loop outputs, accepting a single state or a (3, k) array of states
+    Output: [x_p, x_m, u, v, theta, e]
+    """
+
+    # Closed-loop state
+    x_p = x_cl[0]
+    x_m = x_cl[1]
+    theta = x_cl[2]
+
+    # Reference command
+    r = reference(t)
 
     # Algebraic relationships
     e = x_p - x_m
 
-    # Control law
+    # Control law and constant bias
     u = theta * x_p + r
+    v = V * np.ones_like(u)
 
-    # Constant bias
-    v = V
-
-    return [u, v, theta, e]
-
-IO_ADAPTIVE = control.NonlinearIOSystem(
-    adaptive_state,
-    adaptive_output,
-    inputs=3,
-    outputs=('u', 'v', 'theta', 'e'),
-    states=1,
-    name='control',
-    dt=0
-)
-
-# Define the closed-loop system
-# x_cl = [plant.x_p, ref_model.x_m, control.theta]
-IO_CLOSED = control.InterconnectedSystem(
-    (IO_PLANT, IO_REF_MODEL, IO_ADAPTIVE),
-    connections=(
-        ('plant.u', 'control.u'),
-        ('plant.v', 'control.v'),
-        ('control.u[1]', 'plant.x_p'),
-        ('control.u[2]', 'ref_model.x_m')
-    ),
-    inplist=('control.u[0]'),
-    outlist=('plant.x_p', 'ref_model.x_m', 'control.u', 'control.v', 'control.theta', 'control.e'),
-    dt=0
-)
+    return np.array([C_P * x_p, C_M * x_m, u, v, theta, e])
 
 # Set simulation duration and time steps
 N_POINTS = 3000
 T_F = 30
 
+# Set integrator tolerances: absolute only
+RTOL = 0
+ATOL = 1e-6
+
 # Set initial conditions
 X0 = np.zeros((3, 1))
 X0[0] = X_P_0
 X0[1] = X_M_0
 X0[2] = THETA_0
 
-# Define simulation time span and control input
+# Define simulation time span and reference command
 T = np.linspace(0, T_F, N_POINTS)
-U = np.zeros((1, N_POINTS))
-R_IN = np.zeros(N_POINTS)
-U[0, :] = R_IN
+# The reference is zero throughout, stored only by its breakpoints
+R_BREAKPOINTS = np.array([0.])
+R_VALUES = np.array([0.])
 
-# Simulate the system
-T_OUT, Y_OUT = control.input_output_response(IO_CLOSED, T, U, X0)
+def simulate():
+    """
+    Simulate the closed-loop system
+    Output: time t_out and closed-loop output y_out = [x_p, x_m, u, v, theta, e]
+    """
 
-# Plot the response
-plt.rc('text', usetex=True)
-plt.rc('font', family='sans')
+    x_out = odeint(
+        make_sigma_mod_closed_loop(), X0.ravel(), T, tfirst=True, rtol=RTOL, atol=ATOL).T
 
-FIG = plt.figure(1, figsize=(6, 6), dpi=300, facecolor='w', edgecolor='k')
+    return T, sigma_mod_output(T, x_out)
 
+# Plot the response
 BLUE = '#1269d3'
 WHITE = '#ffffff'
+FIG_DPI = 100
+SAVE_DPI = 300
+
+def _pyplot():
+    """
+    Import and return matplotlib.pyplot with the non-interactive Agg backend
+    Deferred until plotting, so that importing the module and simulating stay cheap
+    """
+
+    # pylint: disable=import-outside-toplevel
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    return plt
+
+def plot(t_out, y_out):
+    """Plot the closed-loop response and save the figure"""
+
+    plt = _pyplot()
+
+    plt.rc('text', usetex=bool(os.environ.get('PUBLISH')))
+    plt.rc('font', family='sans')
+
+    fig = plt.figure(1, figsize=(6, 6), dpi=FIG_DPI, facecolor='w', edgecolor='k')
+
+    ax_1 = fig.add_subplot(3, 1, 1)
+    ax_1.plot(t_out, y_out[0] - y_out[1], label=r'$x_m$', color=BLUE)
+    ax_1.set_title('Tracking Error')
+    ax_1.set_ylabel(r'$e$')
+    ax_1.set_xlabel(r'time ($t$)', fontname="Times New Roman", fontsize=9, fontweight=100)
+    ax_1.set_facecolor(WHITE)
+
+    ax_2 = fig.add_subplot(3, 1, 2)
+    ax_2.plot(t_out, y_out[4] - THETA_STAR, label=r'$\tilde{\theta}$', color=BLUE)
+    ax_2.set_title('Parameter Error')
+    ax_2.set_ylabel(r'$\tilde{\theta}$')
+    ax_2.set_xlabel(r'time ($t$)', fontname="Times New Roman", fontsize=9, fontweight=100)
+    ax_2.set_facecolor(WHITE)
+
+    ax_3 = fig.add_subplot(3, 1, 3)
+    ax_3.plot(y_out[5], y_out[4] - THETA_STAR, label=r'$\tilde{\theta}$', color=BLUE)
+    ax_3.set_title('Errors')
+    ax_3.set_ylabel(r'$\tilde{\theta}$')
+    ax_3.set_xlabel(r'$e$', fontname="Times New Roman", fontsize=9, fontweight=100)
+    ax_3.set_facecolor(WHITE)
+
+    fig.tight_layout()
+    fig.savefig('sigma_mod.png', dpi=SAVE_DPI, bbox_inches='tight')
+    plt.close(fig)
+
+def run():
+    """Simulate the closed-loop system and plot the response"""
+
+    t_out, y_out = simulate()
+    plot(t_out, y_out)
 
-AX_1 = FIG.add_subplot(3, 1, 1)
-AX_1.plot(T_OUT, Y_OUT[0] - Y_OUT[1], label=r'$x_m$', color=BLUE)
-AX_1.set_title('Tracking Error')
-AX_1.set_ylabel(r'$e$')
-AX_1.set_xlabel(r'time ($t$)', fontname="Times New Roman", fontsize=9, fontweight=100)
-AX_1.set_facecolor(WHITE)
-
-AX_2 = FIG.add_subplot(3, 1, 2)
-AX_2.plot(T_OUT, Y_OUT[4] - THETA_STAR, label=r'$\tilde{\theta}$', color=BLUE)
-AX_2.set_title('Parameter Error')
-AX_2.set_ylabel(r'$\tilde{\theta}$')
-AX_2.set_xlabel(r'time ($t$)', fontname="Times New Roman", fontsize=9, fontweight=100)
-AX_2.set_facecolor(WHITE)
-
-AX_3 = FIG.add_subplot(3, 1, 3)
-AX_3.plot(Y_OUT[5], Y_OUT[4] - THETA_STAR, label=r'$\tilde{\theta}$', color=BLUE)
-AX_3.set_title('Errors')
-AX_3.set_ylabel(r'$\tilde{\theta}$')
-AX_3.set_xlabel(r'$e$', fontname="Times New Roman", fontsize=9, fontweight=100)
-AX_3.set_facecolor(WHITE)
-
-FIG.tight_layout()
-FIG.savefig('sigma_mod.png', bbox_inches='tight')
+if __name__ == "__main__":
+    run()